@@ -21,7 +21,10 @@ from dataclasses import dataclass, asdict
 from typing import Optional
 import re
 
-@dataclass
+_REVIEWS_RE = re.compile(r"\d+")
+"""re.Pattern: Matches the numeric part of the reviews count."""
+
+@dataclass(slots=True)
 class BusinessProfile:
     """Represents a business profile with contact and review information.
 
@@ -46,35 +49,25 @@ class BusinessProfile:
     reviews: Optional[str] = None
 
     def __post_init__(self):
-        """Cleans and converts data for `services`, `reviews`, and `rating` after initialization."""
-        self.clean_service()
-        self.clean_reviews()
-        self.clean_rating()
-        
-    def clean_service(self):
-        """Removes the 'Services: ' prefix from `services` if it exists."""
-        if self.services:
-            # Removes the 'Services: ' prefix if present
-            self.services = self.services.strip("Services: ")
-    
-    def clean_reviews(self):
-        """Extracts a numeric value from `reviews` and converts it to an integer.
+        """Cleans and converts data for `services`, `reviews`, and `rating` after initialization.
 
-        If `reviews` contains no numeric value, sets `reviews` to None.
+        Removes the 'Services: ' prefix from `services`, extracts the numeric value of
+        `reviews` as an integer and converts `rating` to a float, setting `reviews` and
+        `rating` to None if they are empty or can not be parsed, so they always match
+        their integer and float database columns.
         """
-        if self.reviews:
-            # Extracts the first numeric sequence in `reviews` and converts it to int
-            match = re.search(r"\d+", self.reviews)
-            self.reviews = int(match[0]) if match else None
-
-    def clean_rating(self):
-        """Converts the `rating` attribute to a float if it can be parsed.
+        services = self.services
+        if services:
+            # Removes the 'Services: ' prefix if present
+            self.services = services.removeprefix("Services: ")
 
-        If `rating` cannot be converted to a float, sets `rating` to None.
-        """
-        if self.rating:
-            try:
-                self.rating = float(self.rating)
-            except ValueError:
-                self.rating = None
+        # Extracts the first numeric sequence in `reviews` and converts it to int
+        reviews = self.reviews
+        match = _REVIEWS_RE.search(reviews) if reviews else None
+        self.reviews = int(match[0]) if match else None
 
+        rating = self.rating
+        try:
+            self.rating = float(rating) if rating else None
+        except ValueError:
+            self.rating = None
@@ -28,9 +28,7 @@ def Calculate_Runtime(start_time):
         >>> # Some process
         >>> hours, minutes, seconds = Calculate_Runtime(start)
     """
-    end_time = time()  # Get the current time
-    runtime_seconds = end_time - start_time  # Calculate the total runtime in seconds
-    hours = int(runtime_seconds / 3600)  # Convert seconds to hours
-    minutes = int((runtime_seconds % 3600) / 60)  # Calculate remaining minutes
-    seconds = int(runtime_seconds % 60)  # Calculate remaining seconds
+    runtime_seconds = int(time() - start_time)  # Calculate the total runtime in whole seconds
+    hours, remaining_seconds = divmod(runtime_seconds, 3600)  # Convert seconds to hours
+    minutes, seconds = divmod(remaining_seconds, 60)  # Split the remaining seconds into minutes and seconds
     return hours, minutes, seconds  # Return the runtime as a tuple
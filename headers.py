@@ -10,34 +10,149 @@ Typical usage example:
     search_url, search_headers, results_count, next_page, pages_contents_list = Get_Headers_and_URL().run(search_subject)
 """
 
-from playwright.sync_api import Playwright, sync_playwright, expect
-from time import time, sleep
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import re
 
 from typing import List, Tuple
 
+PW_CACHE_DIR = "./.pw-cache"
+"""str: User data directory of the persistent browser context, keeps the HTTP cache between runs."""
+
+_PLAYWRIGHT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playwright")
+"""ThreadPoolExecutor: The single thread every awaited Playwright call runs on."""
+
+_LCI_RE = re.compile(r"&lci=\d+")
+"""re.Pattern: Matches the results offset query parameter of the search URL."""
+
+_COUNT_RE = re.compile(r"(?<=\s)\d+")
+"""re.Pattern: Matches the numbers of the "Showing results" label."""
+
+_PROLIST_URL_RE = re.compile(r"localservices/prolist")
+"""re.Pattern: Matches the URL of the Google Local Services results page."""
+
+RESULT_ROW_SELECTOR = 'div[jscontroller="XHXkqb"]'
+"""str: CSS selector of a business row in the results page."""
+
+RESULTS_LABEL_SELECTOR = 'div.AIYI7d[aria-label*="Showing results"]'
+"""str: CSS selector of the "Showing results" label of the results page."""
+
+_LABEL_CHANGED_JS = """([selector, firstPageLabel]) => {
+    const label = document.querySelector(selector);
+    return label !== null && label.innerHTML !== firstPageLabel;
+}"""
+"""str: Page function returning true once the results label differs from the first page one."""
+
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+"""frozenset: Resource types aborted by the route interception, they are not needed to capture the headers."""
+
 class Headers_Master:
     """Handles header management, language settings, and search URL extraction for Google Local Services.
 
     Attributes:
         API (str): The base URL for the API endpoint.
+        ROUTE_PATTERN (str): The glob of the requests passed to the route interception.
         search_url (str): Stores the modified search URL after intercepting requests.
         search_headers (dict): Contains headers from intercepted requests.
         profiles_list (list): Holds a list of profiles retrieved from the API.
+        results_count (int): The total number of results, set from the second results page.
         next_page (bool): Indicates whether there is a next page in the search results.
+        _playwright (Playwright): Shared Playwright instance, started lazily on the first run.
+        _context (BrowserContext): Shared persistent browser context, reused by every run.
     """
     
+    __slots__ = ("search_url", "search_headers", "profiles_list", "results_count", "next_page")
+
     API = "https://www.google.com/localservices/prolist"
-    search_url = ""
-    search_headers = {}
-    profiles_list = []
-    next_page = False
+    ROUTE_PATTERN = "**/localservices/prolist**"
+    _playwright = None
+    _context = None
+
+    def __init__(self) -> None:
+        """Initializes the search state captured by a run."""
+        self.search_url = ""
+        self.search_headers = {}
+        self.profiles_list = []
+        self.results_count = 0
+        self.next_page = False
+
+    @classmethod
+    def get_context(cls):
+        """Returns the shared persistent browser context, launching it on the first call.
+
+        The context lives in `PW_CACHE_DIR` so static assets cached by the browser are
+        reused across retries, between the two header classes and between program runs.
+
+        Returns:
+            BrowserContext: The shared persistent browser context.
+        """
+        if cls._context is None:
+            # Imported here so the modules reusing cached headers don't load Playwright
+            from playwright.sync_api import sync_playwright
+
+            Headers_Master._playwright = sync_playwright().start()
+            Headers_Master._context = cls._playwright.chromium.launch_persistent_context(
+                user_data_dir=PW_CACHE_DIR, headless=True
+            )
+        return cls._context
+
+    @classmethod
+    def close_browser(cls) -> None:
+        """Closes the shared browser context and stops Playwright, if they were started."""
+        if cls._context is not None:
+            cls._context.close()
+            cls._playwright.stop()
+            Headers_Master._context = None
+            Headers_Master._playwright = None
+
+    async def run_async(self, *args) -> tuple:
+        """Awaits `run` on the Playwright thread, so it can be called from the event loop.
+
+        The sync Playwright API can not be used inside a running event loop and the shared
+        context is bound to the thread that launched it, so every call goes through
+        `_PLAYWRIGHT_EXECUTOR`.
+
+        Args:
+            *args: The arguments passed to the `run` method of the subclass.
+
+        Returns:
+            tuple: The value returned by `run`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_PLAYWRIGHT_EXECUTOR, self.run, *args)
+
+    @classmethod
+    async def close_browser_async(cls) -> None:
+        """Awaits `close_browser` on the Playwright thread."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_PLAYWRIGHT_EXECUTOR, cls.close_browser)
+
+    def new_page(self):
+        """Opens a new page in the shared context with the API request interception set up.
+
+        Only the `API` requests are routed, as routing a request disables the browser
+        cache for it, and the cache is forced back on through CDP for the rest of the page.
+
+        Returns:
+            Page: The newly opened page.
+        """
+        context = self.get_context()
+        page = context.new_page()
+        
+        # Intercept the API requests only so every other resource stays cacheable
+        page.route(self.ROUTE_PATTERN, self.__route_intercept__)
+        
+        # Playwright disables the cache once a route is set, turn it back on
+        cdp = context.new_cdp_session(page)
+        cdp.send("Network.setCacheDisabled", {"cacheDisabled": False})
+        return page
 
     def __route_intercept__(self, route):
         """Intercepts and processes route requests matching the API URL.
 
         Removes certain query parameters and specific headers, such as 'cookie',
-        from the request.
+        from the request. Heavy resources (see `BLOCKED_RESOURCE_TYPES`) that are not
+        API requests are aborted, in case `ROUTE_PATTERN` is broadened to other requests.
 
         Args:
             route: The intercepted route object from which headers and URL are extracted.
@@ -45,20 +160,66 @@ class Headers_Master:
         Returns:
             route: The original route after modification.
         """
+        # Abort the images, media, fonts and stylesheets as they only delay the page load
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES and self.API not in route.request.url:
+            return route.abort("blockedbyclient")
+
         # Check if the request URL matches the target API URL
         if self.API in route.request.url:
             # Remove specific query parameter from the URL
-            self.search_url = re.sub(r"\&lci\=\d+", "", route.request.url)
+            self.search_url = _LCI_RE.sub("", route.request.url)
             # Store the request headers in `search_headers`
             self.search_headers = route.request.all_headers()
-            try:
-                # Attempt to remove 'cookie' from headers if it exists
-                del self.search_headers["cookie"]
-            except KeyError:
-                pass  # Do nothing if 'cookie' header is not present
+            # Remove 'cookie' from headers if it exists
+            self.search_headers.pop("cookie", None)
 
         return route.continue_()
 
+    def _capture_pages(self, page) -> List[str]:
+        """Captures the HTML content of the current results page and of the next one, if available.
+
+        Sets `results_count` from the next page and `next_page` to True when it is loaded.
+
+        Args:
+            page: The page object showing the first results page.
+
+        Returns:
+            List[str]: The HTML contents of the loaded results pages.
+        """
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+        # Wait for the first results row to be rendered before capturing the page
+        page.wait_for_selector(RESULT_ROW_SELECTOR)
+        
+        # List to store HTML contents of each page loaded in the browser session
+        pages_contents_list = [page.content()]
+        
+        try:
+            # Keep the results label of the first page to tell when the next page is rendered
+            first_page_label = page.inner_html(RESULTS_LABEL_SELECTOR) if page.query_selector(RESULTS_LABEL_SELECTOR) else None
+            
+            # Attempt to navigate to the next page of results, if available, waiting for its API response
+            with page.expect_response(lambda response: self.API in response.url):
+                page.locator('button[aria-label="Next"]').click()
+            
+            # The next page may be rendered in place, wait for its results to replace the first page ones
+            page.wait_for_function(_LABEL_CHANGED_JS, arg=[RESULTS_LABEL_SELECTOR, first_page_label])
+            page.wait_for_selector(RESULT_ROW_SELECTOR)
+            
+            # Extract and store the total results count
+            self.get_results_count(page.inner_html(RESULTS_LABEL_SELECTOR))
+            
+            # Append the HTML content of the next page to the list
+            pages_contents_list.append(page.content())
+            
+            # Indicate that pagination is available
+            self.next_page = True
+        except (PlaywrightTimeoutError, IndexError):
+            # Log message if no further pages are available
+            print("No more pages available!")
+        
+        return pages_contents_list
+
     def change_language(self, page):
         """Changes the page language to English, if applicable.
 
@@ -71,10 +232,12 @@ class Headers_Master:
         Returns:
             The page object after attempting the language change.
         """
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
         try:
             # Look for a link with role "link" and name "English" and click it
             page.get_by_role("link", name="English").click()
-        except:
+        except PlaywrightTimeoutError:
             pass  # Ignore exceptions if the language link is not found
 
         return page
@@ -92,7 +255,7 @@ class Headers_Master:
             results_count (int): The parsed integer value of available results.
         """
         # Extract the last integer found in the `results_available` string
-        self.results_count = int(re.findall(r"(?<=\s)\d+", results_available)[-1])
+        self.results_count = int(_COUNT_RE.findall(results_available)[-1])
 
 
 class Get_Headers_and_URL(Headers_Master):
@@ -102,6 +265,8 @@ class Get_Headers_and_URL(Headers_Master):
         Headers_Master: The parent class that manages headers and route interception.
     """
     
+    __slots__ = ()
+
     def run(self, search_subject_location) -> tuple:
         """Executes a search on Google, capturing headers, URL, and page contents for local service profiles.
 
@@ -115,21 +280,14 @@ class Get_Headers_and_URL(Headers_Master):
                    and a list of page contents from the search.
         """
         
-        # List to store HTML contents of each page loaded in the browser session
-        pages_contents_list = []
-        
-        # Initialize a Playwright instance and launch a Chromium browser
-        with sync_playwright() as playwright:
-            browser = playwright.chromium.launch(headless=False, slow_mo=500)
-            context = browser.new_context()  # Create a new browser context
-            page = context.new_page()  # Open a new page within the context
-            
-            # Set up route interception to modify headers and URL as requests are made
-            page.route("**/*", self.__route_intercept__)
-            
+        from playwright.sync_api import Error as PlaywrightError
+
+        # Open a page in the shared browser context, intercepting the API requests
+        page = self.new_page()
+        try:
             # Navigate to the Google homepage and wait for the page to load
             page.goto("https://www.google.com")
-            page.wait_for_load_state(state="networkidle")
+            page.wait_for_load_state(state="domcontentloaded")
             
             # Change language to English, if possible
             page = self.change_language(page)
@@ -137,43 +295,24 @@ class Get_Headers_and_URL(Headers_Master):
             # Enter the search query in the Google search bar
             page.get_by_label("Search", exact=True).click()
             page.get_by_label("Search", exact=True).fill(search_subject_location)
-            sleep(0.5)  # Brief pause to ensure the page registers the input
             
             try:
                 # Trigger the search by simulating the Enter key press
                 page.keyboard.press("Enter")
-            except:
+            except PlaywrightError:
                 pass  # Ignore exceptions if search is already triggered
 
-            page.wait_for_load_state(state="networkidle")
+            page.wait_for_load_state(state="domcontentloaded")
             
             # Click on the link to Google Local Services, if present
             page.wait_for_selector('g-more-link > a[href*="https://www.google.com/localservices/prolist?"]').click()
-            page.wait_for_load_state(state="networkidle")
-            
-            # Append the HTML content of the current page to the list
-            pages_contents_list.append(page.content())
-            
-            try:
-                # Attempt to navigate to the next page of results, if available
-                page.locator('button[aria-label="Next"]').click()
-                page.wait_for_load_state(state="networkidle")
-                
-                # Extract and store the total results count
-                self.get_results_count(page.wait_for_selector('div.AIYI7d[aria-label*="Showing results"]').inner_html())
-                
-                # Append the HTML content of the next page to the list
-                pages_contents_list.append(page.content())
-                
-                # Indicate that pagination is available
-                self.next_page = True
-            except:
-                # Log message if no further pages are available
-                print("No more pages available!")
+            page.wait_for_url(_PROLIST_URL_RE)  # Returns as soon as the results page is reached
             
-            # Close the browser context and browser instance
-            context.close()
-            browser.close()
+            # Capture the HTML content of the results pages
+            pages_contents_list = self._capture_pages(page)
+        finally:
+            # Close the page, the browser context is kept for the next run
+            page.close()
         
         # Return the search URL, headers, results count, pagination status, and all captured page contents
         return self.search_url, self.search_headers, self.results_count, self.next_page, pages_contents_list
@@ -184,8 +323,14 @@ class Get_Headers_Subject(Headers_Master):
     
     Inherits:
         Headers_Master: The parent class that manages headers and route interception.
+
+    Attributes:
+        search_subject (str): The subject extracted from the search bar.
+        search_location (str): The location extracted from the search bar.
     """
 
+    __slots__ = ("search_subject", "search_location")
+
     def extract_subject_and_location(self, raw_search_input: str) -> None:
         """Extracts the search subject and location from a raw search input string.
 
@@ -214,57 +359,30 @@ class Get_Headers_Subject(Headers_Master):
                    and a list of page contents from the search.
         """
         
-        # List to store HTML contents of each page loaded in the browser session
-        pages_contents_list = []
-        
-        # Initialize Playwright instance and launch a Chromium browser
-        with sync_playwright() as playwright:
-            browser = playwright.chromium.launch(headless=False, slow_mo=500)
-            context = browser.new_context()  # Create a new browser context
-            page = context.new_page()  # Open a new page within the context
-            
-            # Set up route interception to modify headers and URL as requests are made
-            page.route("**/*", self.__route_intercept__)
-            
+        # Open a page in the shared browser context, intercepting the API requests
+        page = self.new_page()
+        try:
             # Navigate to Google homepage and wait for the page to load
             page.goto("https://www.google.com")
-            page.wait_for_load_state(state="networkidle")
+            page.wait_for_load_state(state="domcontentloaded")
             
             # Change language to English, if possible
             page = self.change_language(page)
-            page.wait_for_load_state(state="networkidle")
+            page.wait_for_load_state(state="domcontentloaded")
             
             # Go to the specified search page URL
             page.goto(search_page_url)
-            page.wait_for_load_state(state="networkidle")
+            page.wait_for_load_state(state="domcontentloaded")
             
             # Extract the search subject and location from the search input field
             raw_search_input = page.wait_for_selector('input[aria-label="Search for a service"]').get_attribute("value")
             self.extract_subject_and_location(raw_search_input)
             
-            # Append the HTML content of the current page to the list
-            pages_contents_list.append(page.content())
-            
-            try:
-                # Attempt to navigate to the next page of results, if available
-                page.locator('button[aria-label="Next"]').click()
-                page.wait_for_load_state(state="networkidle")
-                
-                # Extract and store the total results count
-                self.get_results_count(page.wait_for_selector('div.AIYI7d[aria-label*="Showing results"]').inner_html())
-                
-                # Append the HTML content of the next page to the list
-                pages_contents_list.append(page.content())
-                
-                # Indicate that pagination is available
-                self.next_page = True
-            except:
-                # No more pages or 'Next' button not found; continue without error
-                pass
-            
-            # Close the browser context and browser instance
-            context.close()
-            browser.close()
+            # Capture the HTML content of the results pages
+            pages_contents_list = self._capture_pages(page)
+        finally:
+            # Close the page, the browser context is kept for the next run
+            page.close()
         
         # Return the search subject, location, headers, results count, pagination status, and all captured page contents
         return self.search_subject, self.search_location, self.search_headers, self.results_count, self.next_page, pages_contents_list
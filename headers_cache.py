@@ -0,0 +1,116 @@
+"""caches the crawling headers and url on disk.
+
+contains the Headers_Cache class which saves the search url, headers, and
+results count of a google maps search to a JSON file, so repeated runs of
+the same search can skip the Playwright bootstrap while the headers are
+still valid.
+
+Typical usage example:
+
+    headers_cache = Headers_Cache()
+    cached_headers = headers_cache.load(search_subject)
+    if cached_headers is None:
+        search_url, search_headers, results_count, next_page, pages_contents_list = Get_Headers_and_URL().run(search_subject)
+        headers_cache.save(search_subject, search_url, search_headers, results_count, next_page)
+"""
+
+import json
+import hashlib
+from time import time
+from typing import Optional, Tuple
+
+HEADERS_CACHE_FILE = "./.headers_cache.json"
+"""str: The JSON file the cached headers are stored in."""
+
+HEADERS_CACHE_TTL = 30 * 60
+"""int: The number of seconds the cached headers are considered valid."""
+
+
+class Headers_Cache:
+    """Stores and retrieves the search url and headers of a search on disk.
+
+    Entries are keyed by the SHA-1 of the search subject and expire after `ttl` seconds.
+
+    Attributes:
+        cache_file (str): The path of the JSON cache file.
+        ttl (int): The number of seconds an entry is considered valid.
+    """
+
+    def __init__(self, cache_file: str = HEADERS_CACHE_FILE, ttl: int = HEADERS_CACHE_TTL) -> None:
+        """Initializes the Headers_Cache with the cache file path and entries lifetime.
+
+        Args:
+            cache_file (str): The path of the JSON cache file.
+            ttl (int): The number of seconds an entry is considered valid.
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+
+    def get_key(self, search_subject: str) -> str:
+        """Returns the cache key of a search subject.
+
+        Args:
+            search_subject (str): The search query, e.g. "dentist in Austin, TX, USA".
+
+        Returns:
+            str: The SHA-1 hex digest of the search subject.
+        """
+        return hashlib.sha1(search_subject.encode()).hexdigest()
+
+    def read_entries(self) -> dict:
+        """Reads all the cached entries, returns an empty dict if the cache file is missing or corrupted."""
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as cache:
+                return json.load(cache)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_entries(self, entries: dict) -> None:
+        """Writes all the entries to the cache file, replacing its content."""
+        with open(self.cache_file, "w", encoding="utf-8") as cache:
+            json.dump(entries, cache)
+
+    def load(self, search_subject: str) -> Optional[Tuple[str, dict, int, bool]]:
+        """Loads the cached search url and headers of a search if they are still valid.
+
+        Args:
+            search_subject (str): The search query the headers were captured for.
+
+        Returns:
+            Optional[Tuple[str, dict, int, bool]]: The search url, search headers, results count,
+            and pagination status, or None if the search is not cached or its entry has expired.
+        """
+        entry = self.read_entries().get(self.get_key(search_subject))
+        if entry is None or time() - entry["timestamp"] > self.ttl:
+            return None
+        return entry["search_url"], entry["search_headers"], entry["results_count"], entry["next_page"]
+
+    def save(self, search_subject: str, search_url: str, search_headers: dict, results_count: int, next_page: bool) -> None:
+        """Saves the search url and headers of a search, timestamped with the current time.
+
+        Args:
+            search_subject (str): The search query the headers were captured for.
+            search_url (str): The intercepted search URL.
+            search_headers (dict): The intercepted request headers.
+            results_count (int): The total number of results of the search.
+            next_page (bool): Whether the search has more than one page.
+        """
+        entries = self.read_entries()
+        entries[self.get_key(search_subject)] = {
+            "search_url": search_url,
+            "search_headers": search_headers,
+            "results_count": results_count,
+            "next_page": next_page,
+            "timestamp": time(),
+        }
+        self.write_entries(entries)
+
+    def invalidate(self, search_subject: str) -> None:
+        """Removes the cached entry of a search, if any.
+
+        Args:
+            search_subject (str): The search query whose headers are no longer valid.
+        """
+        entries = self.read_entries()
+        if entries.pop(self.get_key(search_subject), None) is not None:
+            self.write_entries(entries)
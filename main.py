@@ -3,12 +3,85 @@ import asyncio
 from pprint import pprint
 
 from headers import Get_Headers_and_URL
+from headers_cache import Headers_Cache
 from primary_crawler import Primary_Stage_Subject_input
 from secondary_crawler import Secondary_Stage
-from storage_solution import Storage
+from storage_solution import AsyncStorage
 from calculate_time import Calculate_Runtime
+from functools import partial
+from contextlib import aclosing
+from typing import Awaitable, Callable, List, Optional
+
+
+async def crawl(search_subject: str, save_businesses: Callable[[List[dict]], Optional[Awaitable[None]]]) -> int:
+    """Crawls the businesses profiles links and their data under a single event loop.
+
+    The profiles found by the primary stage are put in a queue consumed by the secondary
+    stage while the next search pages are still being fetched.
+
+    Args:
+        search_subject (str): The search query, e.g. "dentist in Austin, TX, USA".
+        save_businesses (Callable[[List[dict]], Optional[Awaitable[None]]]): Saves a batch of the scraped businesses data.
+
+    Returns:
+        int: The number of scraped businesses.
+    """
+    # Reuse the search URL and headers of a previous run if they are still valid
+    headers_cache = Headers_Cache()
+    cached_headers = headers_cache.load(search_subject)
+    if cached_headers is not None:
+        search_url, search_headers, results_count, _ = cached_headers
+        next_page = False  # No page is loaded yet, so every page is fetched
+        pages_contents_list = []
+    else:
+        # Fetch search URL, headers, results count, and page contents
+        search_url, search_headers, results_count, next_page, pages_contents_list = await Get_Headers_and_URL().run_async(search_subject)
+        headers_cache.save(search_subject, search_url, search_headers, results_count, next_page)
     
-    
+    # Initialize the primary stage class for extracting business profiles
+    primary_stage = Primary_Stage_Subject_input(Get_Headers_and_URL, search_url, search_headers, headers_cache)
+
+    # Process each page's content to get business profiles
+    for page_content in pages_contents_list:
+        primary_stage.get_business_profiles(page_content)
+
+    # Start the secondary stage class to fetch detailed business data as the profiles are found
+    profiles_queue = asyncio.Queue()
+    secondary_stage_class = Secondary_Stage(save_businesses)
+    secondary_stage = asyncio.create_task(secondary_stage_class.s_stream(profiles_queue))
+
+    try:
+        # Handle pagination and stream all profiles to the secondary stage
+        async with aclosing(primary_stage.p_handler(next_page, results_count, search_subject)) as profiles:
+            async for profile in profiles:
+                if secondary_stage.done():
+                    break  # The secondary stage failed, stop crawling the search pages
+                profiles_queue.put_nowait(profile)
+        profiles_queue.put_nowait(None)  # Mark the end of the profiles
+
+        return await secondary_stage  # Raises the exception of the secondary stage, if any
+    finally:
+        secondary_stage.cancel()  # Stop the secondary stage if the primary stage failed
+        await Get_Headers_and_URL.close_browser_async()  # Close the shared browser context
+
+
+async def crawl_and_save(search_subject: str, subject: str, location: str) -> int:
+    """Crawls the businesses of a search and saves them to the database from the same event loop.
+
+    Args:
+        search_subject (str): The search query, e.g. "dentist in Austin, TX, USA".
+        subject (str): The subject of the search, saved as the business type.
+        location (str): The location of the search.
+
+    Returns:
+        int: The number of scraped businesses.
+    """
+    # Initialize the storage class for database interactions, the connection pool is closed on exit
+    async with AsyncStorage() as data_base:
+        save_businesses = partial(data_base.save, location=location, subject=subject)
+        return await crawl(search_subject, save_businesses)
+
+
 def search_subject_and_location_input(subject: str, location: str) -> None:
     """Searches for businesses based on the given subject and location, stores results in a database and CSV file.
 
@@ -22,42 +95,20 @@ def search_subject_and_location_input(subject: str, location: str) -> None:
     Raises:
         Exception: Raises an exception if any error occurs during the data fetching process.
     """
-    # Initialize the storage class for database interactions
-    data_base = Storage()
-    data_base.launch_sql_engine()  # Launch the SQL engine
-
     # Format the search subject with location
     search_subject = f"{subject} in {location}, USA"
     print(f"searching for {search_subject}.\n")
     
     start_time = time()  # Record the start time for runtime calculation
     
-    # Fetch search URL, headers, results count, and page contents
-    search_url, search_headers, results_count, next_page, pages_contents_list = Get_Headers_and_URL().run(search_subject)
-    
-    # Initialize the primary stage class for extracting business profiles
-    primary_stage = Primary_Stage_Subject_input(Get_Headers_and_URL, search_url, search_headers)
-
-    # Process each page's content to get business profiles
-    for page_content in pages_contents_list:
-        primary_stage.get_business_profiles(page_content)
-
-    # Handle pagination and get all profiles
-    profiles_list = primary_stage.p_handler(next_page, results_count, search_subject)
-    
-    # Initialize the secondary stage class to fetch detailed business data asynchronously
-    secondary_stage_class = Secondary_Stage()
-    businesses_ = asyncio.run(secondary_stage_class.s_handler(profiles_list))
-    
-    # Save the fetched business data to SQL
-    data_base.save_to_sql_(businesses_, location, subject)
+    # Crawl the profiles and their data, saving the fetched business data to SQL in batches
+    businesses_count = asyncio.run(crawl_and_save(search_subject, subject, location))
 
     # Calculate and print runtime
     hours, minutes, seconds = Calculate_Runtime(start_time)
-    print(f"scraped {len(businesses_)} results successfully in {hours}:{minutes}:{seconds}.")
+    print(f"scraped {businesses_count} results successfully in {hours}:{minutes}:{seconds}.")
 
     print("\n")
-    data_base.end_sql_session()  # Close the SQL session
     print(f"\ndone {'-'*50}")
 
        
@@ -3,64 +3,135 @@
 contains the Primary_Stage_Subject_input class which takes the 
 Get_Headers_and_URL class as an object, the url and headers of 
 a google maps search, crawls their profiles the results pages and 
-returns a list of businesses profiles links.
+asynchronously yields the businesses profiles links as they are found.
 
 Typical usage example:
 
     primary_stage = Primary_Stage_Subject_input(Get_Headers_and_URL, search_url, search_headers)
-    profiles_list = primary_stage.p_handler(next_page, results_count, search_subject)
+    async for profile in primary_stage.p_handler(next_page, results_count, search_subject):
+        profiles_queue.put_nowait(profile)
 """
 
-from time import time, sleep
-from selectolax.parser import HTMLParser
-from requests import session as r_session
+import asyncio
+import re
+from html import unescape
+from selectolax.lexbor import LexborHTMLParser
+import httpx
 from tqdm import tqdm
 from headers import Get_Headers_and_URL
-from typing import List
+from headers_cache import Headers_Cache
+from typing import AsyncIterator, List, Optional
 
 RESULTS_PER_PAGE = 20
 """int: The number of results per page."""
 
+MAX_WORKERS = 8
+"""int: The number of search pages fetched concurrently."""
+
+MAX_BACKOFF = 60
+"""int: The longest wait in seconds before retrying the failed search pages."""
+
+MAX_RETRIES = 8
+"""int: Number of times the failed search pages are retried before they are skipped."""
+
+EXPIRED_HEADERS_RETRIES = 2
+"""int: Number of consecutive retries rejected with EXPIRED_HEADERS_STATUS before the headers are refreshed."""
+
+EXPIRED_HEADERS_STATUS = (401, 403)
+"""tuple: Response statuses meaning the search headers have expired and must be refreshed."""
+
+_PROFILE_MARKER = 'jscontroller="XHXkqb"'
+"""str: The attribute marking the profile elements in the raw HTML."""
+
+_JSDATA_RE = re.compile(r'jscontroller="XHXkqb"[^>]*?jsdata="([^"]*)"')
+"""re.Pattern: Captures the raw 'jsdata' attribute of the profile elements, the profile ID is its second field."""
+
 
 class Primary_Stage_Master:
     """A class responsible for fetching business profiles from HTML content.
 
+    Attributes:
+        profiles_list (List[str]): Accumulated list of profile IDs from all parsed pages.
+        fetch_semaphore (asyncio.Semaphore): Bounds the number of search pages fetched at once.
+
     Methods:
-        get_business_profiles(response_text): Extracts profile IDs from the response HTML and stores them in profiles_list.
-        fetch_search_pages(session, url): Synchronously fetches the HTML content of a search page from a given URL.
+        get_business_profiles(response_text): Extracts profile IDs from the response HTML, stores them in profiles_list and returns them.
+        create_session(headers): Creates the HTTP/2 client used to fetch the search pages.
+        fetch_search_pages(session, url): Asynchronously fetches the HTML content of a search page from a given URL.
     """
     
+    __slots__ = ("profiles_list", "fetch_semaphore")
+
     def __init__(self):
         self.profiles_list: List[str] = []
+        self.fetch_semaphore = asyncio.Semaphore(MAX_WORKERS)
 
-    def get_business_profiles(self, response_text: str) -> None:
+    def get_business_profiles(self, response_text: str) -> List[str]:
         """Extracts business profile IDs from the provided HTML response and appends them to profiles_list.
 
         Args:
             response_text (str): The HTML content of the search page response.
 
+        Returns:
+            List[str]: The profile IDs extracted from this response.
+
         Notes:
-            Parses HTML to find profile elements and extracts 'jsdata' attributes to obtain unique profile IDs.
+            Matches the profile elements 'jsdata' attributes in the raw HTML to obtain unique profile IDs,
+            falling back to parsing the HTML when some profile elements do not match the pattern, e.g.
+            when their 'jsdata' attribute comes before 'jscontroller'.
         """
-        source = HTMLParser(html=response_text)
-        
-        # Extract profile IDs from 'jsdata' attribute in profile elements
-        self.profiles_list += [
-            profile.attributes["jsdata"].split(";")[1]
-            for profile in source.css('div[jscontroller="XHXkqb"]')
+        # Decode the HTML entities of the matched attributes as the parser does, then take their second field
+        profiles = [
+            (unescape(jsdata) if "&" in jsdata else jsdata).partition(";")[2].partition(";")[0]
+            for jsdata in _JSDATA_RE.findall(response_text)
         ]
+        
+        if len(profiles) < response_text.count(_PROFILE_MARKER):
+            source = LexborHTMLParser(response_text)
+            
+            # Extract profile IDs (the second field) from 'jsdata' attribute in profile elements
+            profiles = [
+                profile.attributes["jsdata"].partition(";")[2].partition(";")[0]
+                for profile in source.css('div[jscontroller="XHXkqb"]')
+            ]
+        
+        self.profiles_list.extend(profiles)
+        return profiles
 
-    def fetch_search_pages(self, session, url: str) -> str:
-        """Synchronously fetches the HTML content from the provided URL.
+    def create_session(self, headers: dict) -> httpx.AsyncClient:
+        """Creates an HTTP/2 client keeping its connections alive between the search pages requests.
 
         Args:
-            session (requests.Session): The HTTP session used for making requests.
+            headers (dict): HTTP headers sent with every request.
+
+        Returns:
+            httpx.AsyncClient: The HTTP client used to fetch the search pages.
+        """
+        return httpx.AsyncClient(
+            http2=True,
+            headers=headers,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+            timeout=30,
+        )
+
+    async def fetch_search_pages(self, session: httpx.AsyncClient, url: str) -> str:
+        """Asynchronously fetches the HTML content from the provided URL.
+
+        At most `MAX_WORKERS` pages are fetched at once, bounded by `fetch_semaphore`.
+
+        Args:
+            session (httpx.AsyncClient): The HTTP client used for making requests.
             url (str): The URL of the search page to fetch.
 
         Returns:
             str: The HTML content of the fetched page.
+
+        Raises:
+            httpx.HTTPStatusError: If the response status is 4xx or 5xx.
         """
-        response = session.get(url)
+        async with self.fetch_semaphore:
+            response = await session.get(url)
+        response.raise_for_status()  # EXPIRED_HEADERS_STATUS responses mean the headers have expired, others are retried
         return response.text  # Return HTML content of the search page
 
 
@@ -75,62 +146,135 @@ class Primary_Stage_Subject_input(Primary_Stage_Master):
         search_url (str): Base search URL for fetching profiles.
         search_headers (dict): Headers required for HTTP requests.
         get_headers_and_url_c (Get_Headers_and_URL): Instance for handling dynamic URL and headers fetching.
+        headers_cache (Optional[Headers_Cache]): Disk cache updated when the headers are refreshed.
 
     Methods:
-        p_handler(next_page, results_count, search_subject): Iterates over paginated results, fetching profile data.
+        refresh_headers(search_subject): Captures new search URL and headers with the browser.
+        p_handler(next_page, results_count, search_subject): Iterates over paginated results, yielding profile IDs.
     """
 
-    profiles_list: List[str] = []
+    __slots__ = ("search_url", "search_headers", "get_headers_and_url_c", "headers_cache")
 
-    def __init__(self, get_headers_and_url: Get_Headers_and_URL, search_url: str, search_headers: dict) -> None:
+    def __init__(self, get_headers_and_url: Get_Headers_and_URL, search_url: str, search_headers: dict,
+                 headers_cache: Optional[Headers_Cache] = None) -> None:
         """Initializes Primary_Stage_Subject_input with required URL, headers, and handler instance.
 
         Args:
             get_headers_and_url (Get_Headers_and_URL): Instance for fetching updated headers and URLs.
             search_url (str): Base URL for search queries.
             search_headers (dict): HTTP headers for search requests.
+            headers_cache (Optional[Headers_Cache]): Disk cache to update when the headers are refreshed.
         """
+        super().__init__()
         self.search_url = search_url
         self.search_headers = search_headers
         self.get_headers_and_url_c = get_headers_and_url
+        self.headers_cache = headers_cache
+
+    async def refresh_headers(self, search_subject: str) -> int:
+        """Captures new search URL and headers with the browser, replacing the expired ones.
+
+        Args:
+            search_subject (str): The search term for the desired business subject.
+
+        Returns:
+            int: The total number of results of the refreshed search, 0 if it has a single page.
+        """
+        if self.headers_cache is not None:
+            self.headers_cache.invalidate(search_subject)  # The cached headers have expired
+        search_url, search_headers, results_count, next_page, _ = await self.get_headers_and_url_c().run_async(search_subject)
+        if self.headers_cache is not None:
+            self.headers_cache.save(search_subject, search_url, search_headers, results_count, next_page)
+        
+        self.search_url = search_url
+        self.search_headers = search_headers
+        return results_count
 
-    def p_handler(self, next_page: bool, results_count: int, search_subject: str) -> List[str]:
+    async def p_handler(self, next_page: bool, results_count: int, search_subject: str) -> AsyncIterator[str]:
         """Fetches and parses business profiles from paginated search results.
 
+        Profile IDs already in profiles_list (parsed from the pages loaded by the browser) are
+        yielded first, then the IDs of every fetched page as soon as it is parsed.
+
         Args:
             next_page (bool): Whether there is an additional page to load.
             results_count (int): Total number of results available for pagination.
             search_subject (str): The search term for the desired business subject.
 
-        Returns:
-            List[str]: List of profile IDs extracted from all fetched pages.
+        Yields:
+            str: The profile IDs extracted from all fetched pages.
         """
-        session = r_session()   
-        session.headers = self.search_headers
+        for profile in list(self.profiles_list):
+            yield profile
         
-        # Generate list of page offsets based on total result count
-        pages_available = list(range(0, results_count, RESULTS_PER_PAGE))
+        session = self.create_session(self.search_headers)
         
-        # Adjust the starting page offset if there is already a second page loaded
-        if next_page:
-            pages_available = pages_available[pages_available.index(2 * RESULTS_PER_PAGE):]
-
-        for page in tqdm(pages_available, unit="page", desc="search page"):
-            url = f"{self.search_url}&lci={page}"
-            while True:
-                try:
-                    # Fetch page content and break on successful fetch
-                    text_response = self.fetch_search_pages(session, url)
+        # Generate the page offsets based on total result count, skipping the
+        # first two pages if the second page is already loaded
+        first_page = 2 * RESULTS_PER_PAGE if next_page else 0
+        
+        # A single page search has a results count of 0, so the first page
+        # is always fetched when it was not loaded by the browser
+        last_page = results_count if self.profiles_list else max(results_count, RESULTS_PER_PAGE)
+        pages_available = range(first_page, last_page, RESULTS_PER_PAGE)
+
+        progress_bar = tqdm(total=len(pages_available), unit="page", desc="search page")
+        attempt = 0
+        expired_retries = 0
+        tasks = {}
+        try:
+            while pages_available:
+                # Fetch the pages concurrently, mapping each task to its page offset
+                tasks = {
+                    asyncio.create_task(self.fetch_search_pages(session, f"{self.search_url}&lci={page}")): page
+                    for page in pages_available
+                }
+                failed_pages = []
+                headers_expired = False
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        try:
+                            text_response = task.result()
+                        except (httpx.HTTPStatusError, httpx.RequestError) as error:
+                            # Keep the page offset to be fetched again after the retry
+                            failed_pages.append(tasks[task])
+                            if isinstance(error, httpx.HTTPStatusError) and error.response.status_code in EXPIRED_HEADERS_STATUS:
+                                headers_expired = True
+                            continue
+                    
+                        # Parse profiles from the response HTML and yield them
+                        profiles = self.get_business_profiles(text_response)
+                        progress_bar.update()
+                        for profile in profiles:
+                            yield profile
+            
+                pages_available = failed_pages
+                if not failed_pages:
                     break
-                except:
-                    # Retry fetching URL if there’s an error, reinitialize session and headers if needed
-                    session.close()
-                    sleep(61)  # Wait before retrying to avoid request limit errors
-                    search_url, search_headers, results_count, next_page, _ = self.get_headers_and_url_c().run(search_subject)
-                    session = r_session()
-                    session.headers = search_headers
             
-            # Parse profiles from the response HTML and add to profiles_list
-            self.get_business_profiles(text_response)
-        
-        return self.profiles_list
+                attempt += 1
+                if attempt > MAX_RETRIES:
+                    print(f"\nSkipping {len(failed_pages)} search pages after {MAX_RETRIES} retries.")
+                    break
+                
+                # Count the consecutive retries the headers were rejected on
+                expired_retries = expired_retries + 1 if headers_expired else 0
+                if expired_retries >= EXPIRED_HEADERS_RETRIES:
+                    # The headers are still rejected after a retry, refresh them keeping the session
+                    # and its warm connections, and drop the offsets past the refreshed results count
+                    last_page = max(await self.refresh_headers(search_subject), RESULTS_PER_PAGE)
+                    pages_available = [page for page in failed_pages if page < last_page]
+                    session.headers = self.search_headers
+                    expired_retries = 0
+                else:
+                    # Back off exponentially on rate limits, transient errors and a first rejection of the headers
+                    await asyncio.sleep(min(2 ** attempt, MAX_BACKOFF))
+        finally:
+            # Cancel the fetches left running if the consumer stopped iterating or an error was raised
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await session.aclose()
+            progress_bar.close()
@@ -0,0 +1,58 @@
+"""limits the rate of the crawling requests.
+
+contains the Rate_Limiter class, an asyncio token bucket which paces the
+requests smoothly instead of sending them in bursts followed by long waits,
+without blocking the event loop.
+
+Typical usage example:
+
+    rate_limiter = Rate_Limiter(max_tokens=120, refill_interval=60)
+    await rate_limiter.acquire()
+    response = await session.get(url)
+"""
+
+import asyncio
+from time import monotonic
+
+
+class Rate_Limiter:
+    """An asyncio token bucket allowing `max_tokens` requests per `refill_interval` seconds.
+
+    The bucket starts full and is refilled continuously, so after the first burst the
+    requests are spread evenly over the refill interval.
+
+    Attributes:
+        max_tokens (int): The capacity of the bucket, the largest burst of requests.
+        refill_rate (float): The number of tokens added to the bucket per second.
+        tokens (float): The number of tokens currently available.
+        last_refill (float): The monotonic time the bucket was last refilled at.
+        lock (asyncio.Lock): Serializes the waiting requests so the tokens are handed out in order.
+    """
+
+    def __init__(self, max_tokens: int, refill_interval: float) -> None:
+        """Initializes a full Rate_Limiter.
+
+        Args:
+            max_tokens (int): The number of requests allowed per refill interval.
+            refill_interval (float): The number of seconds it takes to refill an empty bucket.
+        """
+        self.max_tokens = max_tokens
+        self.refill_rate = max_tokens / refill_interval
+        self.tokens = float(max_tokens)
+        self.last_refill = monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self) -> None:
+        """Adds the tokens earned since the last refill, up to max_tokens."""
+        now = monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    async def acquire(self) -> None:
+        """Takes a token from the bucket, waiting without blocking the event loop until one is available."""
+        async with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+                self.refill()
+            self.tokens -= 1
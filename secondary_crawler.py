@@ -1,25 +1,31 @@
 """asynchronously crawls businesses profiles on google maps.
 
 contains the Secondary_Stage class which takes businesses profiles links
-on google maps and returns and asynchronously crawls their profiles, 
-parse the html and reuters the response as a list.
+on google maps and asynchronously crawls their profiles, parses the html
+and hands the businesses data to a saving function in batches.
 
 Typical usage example:
 
-    secondary_stage_class = Secondary_Stage()
-    businesses_ = asyncio.run(secondary_stage_class.s_handler(profiles_list))
+    secondary_stage_class = Secondary_Stage(save_businesses)
+    businesses_count = asyncio.run(secondary_stage_class.s_handler(profiles_list))
+
+or, to fetch the profiles while they are still being crawled:
+
+    businesses_count = await secondary_stage_class.s_stream(profiles_queue)
 """
 
-from time import time, sleep
-from selectolax.parser import HTMLParser
+from selectolax.lexbor import LexborHTMLParser
 from tqdm import tqdm
 from fake_useragent import UserAgent
-from httpx_html import AsyncHTMLSession
 import asyncio
+import inspect
+import httpx
+import random
 
 from business_profile_DC import BusinessProfile
-from dataclasses import asdict
-from typing import List, Tuple
+from rate_limiter import Rate_Limiter
+from dataclasses import fields
+from typing import Awaitable, Callable, Coroutine, List, Optional, Tuple
 
 SECONDARY_STAGE_HEADERS = {
     "User-Agent": "",
@@ -34,38 +40,133 @@ SECONDARY_STAGE_HEADERS = {
 """dict: Headers to be used in secondary stage requests."""
 
 CALL_RATE = 120
-"""int: Maximum number of profiles to process in a single batch."""
+"""int: Maximum number of profiles to process in a single batch, and of profile requests per RATE_LIMIT_WINDOW."""
+
+RATE_LIMIT_WINDOW = 60
+"""int: The number of seconds CALL_RATE profile requests are spread over."""
+
+MAX_CONCURRENT_REQUESTS = 32
+"""int: Maximum number of profile requests in flight at once."""
+
+MAX_RETRIES = 8
+"""int: Number of times a failed profile request is retried before the profile is skipped."""
+
+MAX_BACKOFF = 60
+"""int: The longest wait in seconds before retrying the failed profile requests."""
+
+SAVE_BATCH_SIZE = 10000
+"""int: Number of businesses handed to the saving function at once."""
+
+USER_AGENTS_POOL_SIZE = 64
+"""int: Number of randomized user agents sampled once, the requests pick theirs from them."""
+
+_SELECTORS = (
+    ("business", "div.rgnuSb.tZPcob"),
+    ("website", "div.Gx8NHe"),
+    ("phone_number", "div.eigqqc"),
+    ("services", "div.AQrsxc"),
+    ("address", "div.hgRN0"),
+    ("rating", "span.ZjTWef.QoUabe"),
+    ("reviews", "span.PN9vWe"),
+)
+"""tuple: (field, CSS selector) pairs of the business data in a profile page, shared by every parsed document."""
+
+_PROFILE_FIELDS = tuple(field.name for field in fields(BusinessProfile))
+"""tuple: Names of the BusinessProfile fields, the keys of the business information dictionaries."""
 
 
 class Secondary_Stage:
     """Handles asynchronous fetching and processing of business data from given profile URLs.
 
+    The fetched profiles go through a pipeline of bounded queues, they are parsed and saved
+    in batches while the next profiles are fetched, so memory stays constant whatever the job size.
+
     Attributes:
-        business_info_list (list): Stores extracted business information as dictionaries.
-        ua (UserAgent): Randomized user agent generator for request headers.
+        user_agents (List[str]): Randomized user agents sampled once, picked from for the request headers.
+        async_session (httpx.AsyncClient): The HTTP/2 client used to fetch the profiles, created once per handler run.
+        semaphore (asyncio.Semaphore): Bounds the number of profile requests in flight.
+        rate_limiter (Rate_Limiter): Paces the profile requests to CALL_RATE per RATE_LIMIT_WINDOW.
+        save_businesses (Callable[[List[dict]], Optional[Awaitable[None]]]): Saves a batch of business information dictionaries.
+        responses_queue (asyncio.Queue): Fetched (HTML content, profile URL) tuples waiting to be parsed.
+        businesses_queue (asyncio.Queue): Parsed business information dictionaries waiting to be saved.
+        businesses_count (int): The number of businesses saved so far.
     """
-    
-    business_info_list = []
-    ua = UserAgent()
 
-    async def fetch_businesses(self, session: AsyncHTMLSession, url: str) -> Tuple[str, str]:
-        """Fetches business HTML data from the provided URL asynchronously.
+    def __init__(self, save_businesses: Callable[[List[dict]], Optional[Awaitable[None]]]) -> None:
+        """Initializes the Secondary_Stage with its user agents pool, requests concurrency and rate limits and pipeline queues.
 
         Args:
-            session (AsyncHTMLSession): The session for making HTTP requests.
+            save_businesses (Callable[[List[dict]], Optional[Awaitable[None]]]): Saves a batch of business
+                information dictionaries, a coroutine function is awaited, otherwise it is run in a thread
+                so it may block.
+        """
+        user_agent_generator = UserAgent()
+        self.user_agents = [user_agent_generator.random for _ in range(USER_AGENTS_POOL_SIZE)]
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.rate_limiter = Rate_Limiter(max_tokens=CALL_RATE, refill_interval=RATE_LIMIT_WINDOW)
+        self.save_businesses = save_businesses
+        self.responses_queue = asyncio.Queue(maxsize=CALL_RATE)
+        self.businesses_queue = asyncio.Queue(maxsize=SAVE_BATCH_SIZE)
+        self.businesses_count = 0
+
+    async def fetch_businesses(self, session: httpx.AsyncClient, url: str, user_agent: str) -> Tuple[str, str]:
+        """Fetches business HTML data from the provided URL asynchronously, once the rate limiter allows it.
+
+        Args:
+            session (httpx.AsyncClient): The HTTP client for making requests.
             url (str): The target URL to fetch.
+            user_agent (str): The User-Agent header sent with the request.
 
         Returns:
             Tuple[str, str]: A tuple containing the HTML content and the URL.
 
         Raises:
-            Exception: If the response status is not 200 (OK).
+            httpx.HTTPStatusError: If the response status is not 200 (OK).
         """
-        response = await session.get(url)
+        await self.rate_limiter.acquire()
+        async with self.semaphore:
+            response = await session.get(url, headers={"User-Agent": user_agent})
         if response.status_code != 200:
-            raise Exception("Connection error!")
+            raise httpx.HTTPStatusError("Connection error!", request=response.request, response=response)
         return response.text, url
 
+    def get_retry_delay(self, attempt: int, errors: List[BaseException]) -> float:
+        """Computes the wait before retrying failed requests, an exponential backoff with jitter.
+
+        A longer `Retry-After` header of a 429 response takes precedence over the backoff.
+
+        Args:
+            attempt (int): The number of the retry, starting at 1.
+            errors (list): The exceptions raised by the failed requests.
+
+        Returns:
+            float: The number of seconds to wait.
+        """
+        delay = min(2 ** attempt + random.random(), MAX_BACKOFF)
+        for error in errors:
+            if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+                try:
+                    delay = max(delay, float(error.response.headers.get("Retry-After", 0)))
+                except ValueError:
+                    pass  # Retry-After given as a date, keep the backoff
+        return delay
+
+    def is_retriable(self, error: httpx.HTTPError) -> bool:
+        """Tells whether a failed profile request may succeed if retried.
+
+        Args:
+            error (httpx.HTTPError): The exception raised by the request.
+
+        Returns:
+            bool: True for transport errors, 429 and 5xx responses, False for the other, permanent, errors.
+        """
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+            return status_code == 429 or status_code >= 500
+        return False
+
     def create_profiles_array(self, profiles_list: List[str]) -> List[List[str]]:
         """Divides a list of profiles into smaller arrays based on the CALL_RATE limit.
 
@@ -75,96 +176,236 @@ class Secondary_Stage:
         Returns:
             list: Nested list of profile URLs, split according to CALL_RATE.
         """
-        if CALL_RATE >= len(profiles_list):
-            profiles_arrays = [profiles_list]
+        return [profiles_list[i:i + CALL_RATE] for i in range(0, len(profiles_list), CALL_RATE)]
+
+    def get_business_data(self, source_code: str, profile: str) -> dict:
+        """Parses and extracts business data from an HTML response.
+
+        Args:
+            source_code (str): The HTML content of the profile.
+            profile (str): The profile URL.
+
+        Returns:
+            dict: The business information, fields missing from the page are None.
+        """
+        css_first = LexborHTMLParser(source_code).css_first
+        
+        # Fields missing from the profile page are left as None
+        business_data = {
+            field: node.text() if (node := css_first(selector)) is not None else None
+            for field, selector in _SELECTORS
+        }
+        
+        # Clean the fields through BusinessProfile, reading them back without asdict's deep copy
+        business = BusinessProfile(profile=profile, **business_data)
+        return {field: getattr(business, field) for field in _PROFILE_FIELDS}
+
+    async def parse_businesses(self) -> None:
+        """Parses the fetched profiles from responses_queue into businesses_queue, until the None end marker.
+
+        The parsing runs in a thread so it does not block the event loop fetching the next profiles.
+        """
+        while (response := await self.responses_queue.get()) is not None:
+            await self.businesses_queue.put(await asyncio.to_thread(self.get_business_data, *response))
+        await self.businesses_queue.put(None)
+
+    async def save_batch(self, businesses: List[dict]) -> None:
+        """Saves a batch of businesses, awaiting the saving function if it is a coroutine function.
+
+        Args:
+            businesses (list): The business information dictionaries to save.
+        """
+        if inspect.iscoroutinefunction(self.save_businesses):
+            await self.save_businesses(businesses)
         else:
-            profiles_arrays = []
-            sub_list = []
+            await asyncio.to_thread(self.save_businesses, businesses)
+        self.businesses_count += len(businesses)
+
+    async def store_businesses(self) -> None:
+        """Saves the parsed businesses from businesses_queue in batches of SAVE_BATCH_SIZE, until the None end marker."""
+        businesses = []
+        while (business := await self.businesses_queue.get()) is not None:
+            businesses.append(business)
+            if len(businesses) == SAVE_BATCH_SIZE:
+                await self.save_batch(businesses)
+                businesses = []
+
+        # Save the last, partial batch
+        if businesses:
+            await self.save_batch(businesses)
 
-            # Split profiles_list into sub-lists based on CALL_RATE
-            for profile in profiles_list:
-                sub_list.append(profile)
-                if (profiles_list.index(profile) + 1) % CALL_RATE == 0 or profile is profiles_list[-1]:
-                    profiles_arrays.append(sub_list)
-                    sub_list = []
-        return profiles_arrays
+    async def run_pipeline(self, fetch_profiles: Coroutine) -> int:
+        """Runs a profiles fetching coroutine along with the parsing and saving workers.
 
-    def get_business_data(self, responses_list: List[Tuple[str, str]]) -> None:
-        """Parses and extracts business data from HTML responses.
+        If one of them fails the others are cancelled, as they would block on the queues
+        no longer drained, and the exception is raised.
 
         Args:
-            responses_list (list): List of tuples containing HTML content and profile URL.
+            fetch_profiles (Coroutine): Puts the fetched profiles in responses_queue, then None once done.
+
+        Returns:
+            int: The number of businesses saved.
         """
-        for source_code, profile in responses_list:
-            source = HTMLParser(html=source_code)
-            
-            # Append parsed business data as a dictionary to business_info_list
-            self.business_info_list.append(
-                asdict(
-                    BusinessProfile(
-                        profile=profile,
-                        business=source.css_first("div.rgnuSb.tZPcob").text(),
-                        website=source.css_first("div.Gx8NHe").text(),
-                        phone_number=source.css_first("div.eigqqc").text(),
-                        services=source.css_first("div.AQrsxc").text(),
-                        address=source.css_first("div.hgRN0").text(),
-                        rating=source.css_first("span.ZjTWef.QoUabe").text(),
-                        reviews=source.css_first("span.PN9vWe").text()
-                    )
-                )
+        self.async_session = self.create_session()
+        tasks = [
+            asyncio.create_task(fetch_profiles),
+            asyncio.create_task(self.parse_businesses()),
+            asyncio.create_task(self.store_businesses()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Cancel the other stages if one failed or the pipeline was cancelled
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.async_session.aclose()
+        return self.businesses_count
+
+    def create_session(self) -> httpx.AsyncClient:
+        """Creates the HTTP/2 client used to fetch the profiles, its connections are kept alive between batches.
+
+        The User-Agent is not set on the client, it is rotated per batch and sent with each request.
+
+        Returns:
+            httpx.AsyncClient: The HTTP client for making requests.
+        """
+        return httpx.AsyncClient(
+            http2=True,
+            headers=SECONDARY_STAGE_HEADERS,
+            limits=httpx.Limits(max_keepalive_connections=MAX_CONCURRENT_REQUESTS, max_connections=MAX_CONCURRENT_REQUESTS),
+            timeout=30,
+        )
+
+    async def fetch_batch(self, profiles_sub_list: List[str]) -> None:
+        """Fetches a batch of profiles into responses_queue, retrying only the failed requests with a new User-Agent.
+
+        The transient failures (see `is_retriable`) are retried after an exponential backoff, up to
+        MAX_RETRIES times, the profiles failing with any other HTTP error are skipped at once, and
+        the session is only recreated when its connection pool is exhausted.
+
+        Args:
+            profiles_sub_list (list): List of at most CALL_RATE profile URLs.
+
+        Raises:
+            Exception: Any non-HTTP exception raised while fetching a profile.
+        """
+        user_agent = random.choice(self.user_agents)
+        pending_profiles = profiles_sub_list
+        attempt = 0
+        while True:
+            # Fetch every pending profile, keeping the exceptions of the failed ones
+            results = await asyncio.gather(
+                *[self.fetch_businesses(self.async_session, profile, user_agent) for profile in pending_profiles],
+                return_exceptions=True
             )
+            failed_profiles = []
+            errors = []
+            skipped_count = 0
+            for profile, result in zip(pending_profiles, results):
+                if not isinstance(result, BaseException):
+                    await self.responses_queue.put(result)
+                elif not isinstance(result, httpx.HTTPError):
+                    raise result  # A bug, not a failed request
+                elif self.is_retriable(result):
+                    failed_profiles.append(profile)
+                    errors.append(result)
+                else:
+                    skipped_count += 1  # Permanent errors, e.g. 404, are not retried
+            
+            if skipped_count:
+                print(f"\nSkipping {skipped_count} profiles that can not be fetched.")
+            
+            if not failed_profiles:
+                break
+            
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                print(f"\nSkipping {len(failed_profiles)} profiles after {MAX_RETRIES} retries.")
+                break
+            
+            print(f"\n{len(failed_profiles)} requests failed, retrying...")
+            await asyncio.sleep(self.get_retry_delay(attempt, errors))
+            
+            if any(isinstance(error, httpx.PoolTimeout) for error in errors):
+                # Replace the session only if its connection pool is exhausted
+                await self.async_session.aclose()
+                self.async_session = self.create_session()
+            
+            # Retry the failed profiles with a new randomized User-Agent
+            pending_profiles = failed_profiles
+            user_agent = random.choice(self.user_agents)
 
-    async def s_handler(self, profiles_list: List[str]) -> List[dict]:
-        """Manages the asynchronous session for fetching business data and handles session errors and retry logic.
+    async def fetch_profiles_list(self, profiles_list: List[str]) -> None:
+        """Fetches a list of profiles in batches of CALL_RATE profiles.
 
         Args:
             profiles_list (list): List of profile URLs to fetch data from.
-
-        Returns:
-            list: List of business information dictionaries.
         """
-        async_session = AsyncHTMLSession()
-        headers_ = SECONDARY_STAGE_HEADERS
-        headers_["User-Agent"] = self.ua.random
-        async_session.headers = headers_
+        # Remove the duplicate profiles before fetching them, keeping their order
+        profiles_list = list(dict.fromkeys(profiles_list))
 
         # Split profiles list into arrays based on CALL_RATE
         profiles_arrays = self.create_profiles_array(profiles_list)
 
         for profiles_sub_list in tqdm(profiles_arrays, unit="list", desc="business array"):
-            while True:
-                try:
-                    start = time()
-                    
-                    # Create async tasks for each profile in the sub-list
-                    co_routines = [asyncio.create_task(self.fetch_businesses(async_session, profile)) for profile in profiles_sub_list]
-                    responses_list = await asyncio.gather(*co_routines)
-                    break  # Exit loop if requests are successful
-                except:
-                    # Close session on failure and retry after delay
-                    await async_session.close()
-                    print("\nSession error, retrying...")
-                    # Wait to respect rate limit if needed
-                    try:
-                        sleep(61 - (time() - start))
-                    except:
-                        pass
-                    
-                    # Reinitialize session with randomized User-Agent
-                    async_session = AsyncHTMLSession()
-                    headers_ = SECONDARY_STAGE_HEADERS
-                    headers_["User-Agent"] = self.ua.random
-                    async_session.headers = headers_
-
-            # Process the responses and extract business data
-            self.get_business_data(responses_list)
-
-            # Wait before the next set of requests if not the last batch
-            if profiles_sub_list is not profiles_arrays[-1]:
-                try:
-                    sleep(61 - (time() - start))
-                except:
-                    pass
+            await self.fetch_batch(profiles_sub_list)
 
-        # Return the full list of extracted business information
-        return self.business_info_list
+        await self.responses_queue.put(None)  # Mark the end of the responses
+
+    async def fetch_profiles_queue(self, profiles_queue: asyncio.Queue) -> None:
+        """Fetches the profiles put in a queue, in batches of at most CALL_RATE profiles.
+
+        Each batch takes every profile available in the queue once the previous batch is fetched,
+        so the profiles keep being produced while a batch is fetched.
+        Profiles already taken from the queue are skipped.
+
+        Args:
+            profiles_queue (asyncio.Queue): Queue of profile URLs, ended by a None item.
+        """
+        progress_bar = tqdm(unit="profile", desc="business profile")
+        seen_profiles = set()
+
+        while (profile := await profiles_queue.get()) is not None:
+            if profile in seen_profiles:
+                continue  # Skip the duplicate profiles before fetching them
+            seen_profiles.add(profile)
+
+            # Take the profiles produced so far, up to CALL_RATE
+            profiles_sub_list = [profile]
+            while len(profiles_sub_list) < CALL_RATE and not profiles_queue.empty():
+                profile = profiles_queue.get_nowait()
+                if profile is None:
+                    profiles_queue.put_nowait(None)  # Keep the end of the queue for the outer loop
+                    break
+                if profile not in seen_profiles:
+                    seen_profiles.add(profile)
+                    profiles_sub_list.append(profile)
+
+            await self.fetch_batch(profiles_sub_list)
+            progress_bar.update(len(profiles_sub_list))
+
+        progress_bar.close()
+        await self.responses_queue.put(None)  # Mark the end of the responses
+
+    async def s_handler(self, profiles_list: List[str]) -> int:
+        """Fetches, parses and saves the business data of a list of profiles.
+
+        Args:
+            profiles_list (list): List of profile URLs to fetch data from.
+
+        Returns:
+            int: The number of businesses saved.
+        """
+        return await self.run_pipeline(self.fetch_profiles_list(profiles_list))
+
+    async def s_stream(self, profiles_queue: asyncio.Queue) -> int:
+        """Fetches, parses and saves the business data of the profiles put in a queue.
+
+        Args:
+            profiles_queue (asyncio.Queue): Queue of profile URLs, ended by a None item.
+
+        Returns:
+            int: The number of businesses saved.
+        """
+        return await self.run_pipeline(self.fetch_profiles_queue(profiles_queue))